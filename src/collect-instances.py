@@ -1,12 +1,18 @@
 #! /usr/bin/env python3
 
 import argparse
+from bisect import bisect_left
 from collections import defaultdict
-import hashlib
-import json
+from concurrent.futures import ThreadPoolExecutor
+import os
 from pathlib import Path
 import random
 import shutil
+import sys
+
+import blake3
+import numpy as np
+import orjson
 
 import domains
 import utils
@@ -15,6 +21,8 @@ import utils
 DIR = Path(__file__).resolve().parent
 REPO = DIR.parent
 RUNTIME_BOUNDS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, float("inf")]
+_BUF = bytearray(1 << 20)
+_BUF_VIEW = memoryview(_BUF)
 
 
 def parse_args():
@@ -27,16 +35,69 @@ def parse_args():
     return parser.parse_args()
 
 
-def _compute_md5_hash(s):
-    m = hashlib.md5()
-    m.update(s.encode("utf-8"))
-    return m.hexdigest()
-
-
 def hash_task(plan_dir):
-    with open(plan_dir / "problem.pddl") as f:
-        content = f.read()
-    return _compute_md5_hash(content)
+    # The hash is only a fingerprint for detecting duplicates, so use the fast BLAKE3.
+    # Stream the file through a reusable buffer to avoid decoding and copying it.
+    m = blake3.blake3()
+    with open(plan_dir / "problem.pddl", "rb") as f:
+        while True:
+            n = f.readinto(_BUF)
+            if not n:
+                break
+            m.update(_BUF_VIEW[:n])
+    return m.hexdigest(length=16)
+
+
+def is_duplicate_task(plan_dir, seen_tasks):
+    """
+    Check whether we have seen the task before and remember it otherwise.
+
+    *seen_tasks* maps problem file sizes to the set of hashes of the tasks
+    with this size. Tasks with a new size can't be duplicates, so we store
+    their plan directory and only compute hashes once another task with the
+    same size shows up.
+    """
+    size = (plan_dir / "problem.pddl").stat().st_size
+    seen = seen_tasks.get(size)
+    if seen is None:
+        seen_tasks[size] = plan_dir
+        return False
+    if isinstance(seen, Path):
+        seen = seen_tasks[size] = {hash_task(seen)}
+    hash = hash_task(plan_dir)
+    if hash in seen:
+        return True
+    seen.add(hash)
+    return False
+
+
+def _iter_subdirs(path, prefix=""):
+    try:
+        it = os.scandir(path)
+    except OSError:
+        # Skip missing and unreadable directories like Path.glob() does.
+        return
+    with it:
+        for entry in it:
+            # DirEntry caches the file type from readdir(), which avoids a stat() call.
+            if entry.name.startswith(prefix) and entry.is_dir():
+                yield entry.path
+
+
+def _iter_properties_files(expdir):
+    """
+    Yield the paths of all smac-output-*/run_*/plan/*/*/properties.json files as strings.
+    """
+    for output_dir in _iter_subdirs(expdir, "smac-output-"):
+        for run_dir in _iter_subdirs(output_dir, "run_"):
+            plan_root = os.path.join(run_dir, "plan")
+            if not os.path.isdir(plan_root):
+                continue
+            for task_dir in _iter_subdirs(plan_root):
+                for plan_dir in _iter_subdirs(task_dir):
+                    properties_file = os.path.join(plan_dir, "properties.json")
+                    if os.path.isfile(properties_file):
+                        yield properties_file
 
 
 def record_max_values(parameters, max_domain_values):
@@ -45,86 +106,162 @@ def record_max_values(parameters, max_domain_values):
             max_domain_values[key] = value
 
 
+class MaxValues:
+    """
+    Track the maximum value of each parameter of a domain.
+
+    As long as all tasks have the parameters of the first task, numeric values
+    are kept in an array with a fixed key order, so recording a task takes a
+    single vectorized maximum. Other values (e.g., strings) are compared one
+    by one. Once a task with different parameters shows up, we switch to
+    comparing all values one by one.
+    """
+    def __init__(self):
+        self.numeric_keys = None
+        self.keys = None
+        self.int_keys = set()
+        self.other_keys = []
+        self.max_array = None
+        self.other_values = {}
+        # Per-key maximum values after switching to one-by-one comparisons.
+        self.fallback_values = None
+
+    def _init_keys(self, values):
+        self.keys = set(values)
+        self.numeric_keys = sorted(
+            key for key, value in values.items() if isinstance(value, (int, float)))
+        self.int_keys = set(self.numeric_keys)
+        self.other_keys = sorted(self.keys - set(self.numeric_keys))
+        self.max_array = np.full(len(self.numeric_keys), -np.inf)
+
+    def _has_known_keys(self, values):
+        return values.keys() == self.keys and all(
+            isinstance(values[key], (int, float)) for key in self.numeric_keys)
+
+    def record(self, values):
+        if self.numeric_keys is None:
+            self._init_keys(values)
+        if self.fallback_values is None and not self._has_known_keys(values):
+            self.fallback_values = self.to_dict()
+        if self.fallback_values is not None:
+            record_max_values(values, self.fallback_values)
+            return
+        # Only print values as integers if all values of the key are integers.
+        if self.int_keys:
+            self.int_keys = {key for key in self.int_keys if isinstance(values[key], int)}
+        row = np.fromiter(
+            (values[key] for key in self.numeric_keys), dtype=np.float64, count=len(self.numeric_keys))
+        np.maximum(self.max_array, row, out=self.max_array)
+        for key in self.other_keys:
+            value = values[key]
+            if key not in self.other_values or value > self.other_values[key]:
+                self.other_values[key] = value
+
+    def to_dict(self):
+        if self.fallback_values is not None:
+            return dict(self.fallback_values)
+        max_values = dict(self.other_values)
+        for key, value in zip(self.numeric_keys, self.max_array.tolist()):
+            max_values[key] = int(value) if key in self.int_keys else value
+        return max_values
+
+
 def get_runtime_bound(runtime):
-    for bound in RUNTIME_BOUNDS:
-        if runtime <= bound:
-            return bound
+    index = bisect_left(RUNTIME_BOUNDS, runtime)
+    if index < len(RUNTIME_BOUNDS):
+        return RUNTIME_BOUNDS[index]
 
 
 def record_runtime(domain_runtimes, bound):
-    if bound not in domain_runtimes:
-        domain_runtimes[bound] = 0
     domain_runtimes[bound] += 1
 
 
 def print_max_values(max_values):
     print("\nMax values:\n")
-    for domain, max_values in sorted(max_values.items()):
+    for domain in sorted(max_values):
+        domain_values = max_values[domain].to_dict()
         print(f" {domain}")
-        for key, value in sorted(max_values.items()):
-            print(f"  {key}: {value}")
+        for key in sorted(domain_values):
+            print(f"  {key}: {domain_values[key]}")
         print()
 
 
 def print_task_count(runtimes):
     print("Tasks:")
-    for domain, domain_runtimes in sorted(runtimes.items()):
-        print(f" {domain}: {sum(domain_runtimes.values())}")
+    for domain in sorted(runtimes):
+        print(f" {domain}: {sum(runtimes[domain].values())}")
 
 
 def print_runtimes(runtimes):
     print("\nRuntime smaller than:")
-    for domain, runtimes_dict in sorted(runtimes.items()):
-        runtimes = ", ".join(f"{k}s: {v}" for k, v in sorted(runtimes_dict.items()))
-        print(f" {domain}: {runtimes}")
+    for domain in sorted(runtimes):
+        domain_runtimes = runtimes[domain]
+        runtimes_string = ", ".join(f"{k}s: {domain_runtimes[k]}" for k in sorted(domain_runtimes))
+        print(f" {domain}: {runtimes_string}")
 
 
 def main():
     args = parse_args()
     expdir = Path(args.expdir)
     destdir = Path(args.destdir)
-    properties_files = list(expdir.glob("smac-output-*/run_*/plan/*/*/properties.json"))
+    if not expdir.is_dir():
+        sys.exit(f"Error: experiment directory not found: {expdir}")
+    properties_files = list(_iter_properties_files(expdir))
     print(f"Found {len(properties_files)} properties files")
     # Avoid bias when selecting instances.
     random.shuffle(properties_files)
-    max_values = defaultdict(dict)
-    seen_task_hashes = defaultdict(set)
-    seen_runtimes = defaultdict(dict)
-    for properties_file in properties_files:
-        plan_dir = properties_file.parent
-        with open(properties_file) as f:
-            props = json.load(f)
-        if props["planner_exitcode"] != 0:
-            continue
-        print(f"Found {props}")
-        domain_name = props["domain"]
-        runtime = props["runtime"]
-
-        if runtime < args.min_runtime:
-            print(f"Skip easy task with runtime {runtime}")
-            continue
-
-        # Skip duplicate tasks.
-        hash = hash_task(plan_dir)
-        if hash in seen_task_hashes[domain_name]:
-            print("Skip duplicate task")
-            continue
-        else:
-            seen_task_hashes[domain_name].add(hash)
-
-        values = props["parameters"].copy()
-        values["planner_runtime"] = runtime
-        record_max_values(values, max_values[domain_name])
-
-        runtime_bound = get_runtime_bound(runtime)
-        if seen_runtimes[domain_name].get(runtime_bound, 0) >= args.max_tasks_per_runtime_block:
-            print("Skip task with overrepresented runtime")
-            continue
-        record_runtime(seen_runtimes[domain_name], runtime_bound)
-
-        domain = domains.get_domains()[domain_name]
-        utils.collect_task(
-            domain, props["parameters"], props["seed"], srcdir=plan_dir, destdir=destdir, copy_logs=args.logs)
+    max_values = defaultdict(MaxValues)
+    seen_tasks = defaultdict(dict)
+    seen_runtimes = defaultdict(lambda: defaultdict(int))
+    # Names of the problem files that are already being collected.
+    collected_problems = set()
+    # Copy accepted tasks in the background while we parse and hash the next ones.
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        copy_futures = []
+        for properties_file in properties_files:
+            properties_file = Path(properties_file)
+            plan_dir = properties_file.parent
+            with open(properties_file, "rb") as f:
+                props = orjson.loads(f.read())
+            if props["planner_exitcode"] != 0:
+                continue
+            print(f"Found {props}")
+            domain_name = props["domain"]
+            runtime = props["runtime"]
+
+            if runtime < args.min_runtime:
+                print(f"Skip easy task with runtime {runtime}")
+                continue
+
+            # Skip duplicate tasks.
+            if is_duplicate_task(plan_dir, seen_tasks[domain_name]):
+                print("Skip duplicate task")
+                continue
+
+            # Rounded parameter values can map different tasks to the same file.
+            problem_name = utils.get_problem_name(props["parameters"], props["seed"])
+            if (domain_name, problem_name) in collected_problems:
+                print(f"Skip task with already used problem name {problem_name}")
+                continue
+
+            values = {**props["parameters"], "planner_runtime": runtime}
+            max_values[domain_name].record(values)
+
+            runtime_bound = get_runtime_bound(runtime)
+            if seen_runtimes[domain_name].get(runtime_bound, 0) >= args.max_tasks_per_runtime_block:
+                print("Skip task with overrepresented runtime")
+                continue
+            record_runtime(seen_runtimes[domain_name], runtime_bound)
+
+            domain = domains.get_domains()[domain_name]
+            collected_problems.add((domain_name, problem_name))
+            copy_futures.append(pool.submit(
+                utils.collect_task,
+                domain, props["parameters"], props["seed"], srcdir=plan_dir, destdir=destdir, copy_logs=args.logs))
+
+        for future in copy_futures:
+            # Propagate errors from the worker threads.
+            future.result()
 
     print_max_values(max_values)
     print_task_count(seen_runtimes)
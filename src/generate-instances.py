@@ -1,17 +1,22 @@
 #! /usr/bin/env python3
 
 import argparse
-import json
+import atexit
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import os
 from pathlib import Path
 import random
 import re
 import resource
+import sqlite3
 import subprocess
 import sys
 import warnings
 
+import blake3
 import numpy as np
+import orjson
 
 from smac.configspace import ConfigurationSpace
 from smac.scenario.scenario import Scenario
@@ -30,6 +35,8 @@ warnings.simplefilter(action="ignore", category=DeprecationWarning)
 DIR = Path(__file__).resolve().parent
 REPO = DIR.parent
 DOMAINS = domains.get_domains()
+RUNTIME_REGEX = re.compile(rb"runtime: (.+?)s real")
+RUNTIME_TAIL_SIZE = 4096
 
 
 def parse_args():
@@ -44,7 +51,7 @@ def parse_args():
     parser.add_argument(
         "--max-configurations",
         type=int,
-        default=sys.maxsize,
+        default=2**31 - 1,
         help="Maximum number of configurations to try (default: %(default)s)",
     )
 
@@ -122,6 +129,10 @@ if PLANNER.name == "sse.sif":
 else:
     COMMAND = ["bash", DIR / "run-singularity.sh", PLANNER, "domain.pddl", "problem.pddl", "sas_plan"]
 
+# Compress planner logs in the background while SMAC evaluates the next configuration.
+XZ_POOL = ThreadPoolExecutor(max_workers=2)
+atexit.register(XZ_POOL.shutdown, wait=True)
+
 RUNNER = Runner(
     DOMAIN,
     COMMAND,
@@ -131,6 +142,51 @@ RUNNER = Runner(
 )
 
 
+def open_eval_cache(path):
+    """
+    Open the cache of evaluation results that is shared by all parallel SMAC runs.
+
+    The parallel runs may live on different hosts that share a network
+    filesystem, so we use the default rollback journal instead of WAL, which
+    needs shared memory on a single host. Since the cache is only an
+    optimization, errors never abort the run: we return None if the cache
+    can't be opened.
+    """
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        # Switch caches created in WAL mode back to the rollback journal.
+        connection.execute("PRAGMA journal_mode=DELETE")
+        connection.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, cost REAL NOT NULL)")
+    except (OSError, sqlite3.Error) as err:
+        logging.warning(f"Failed to open evaluation cache {path}: {err}")
+        return None
+    return connection
+
+
+def lookup_cached_cost(key):
+    if EVAL_CACHE is None:
+        return None
+    try:
+        row = EVAL_CACHE.execute("SELECT cost FROM cache WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error as err:
+        logging.warning(f"Failed to read from evaluation cache: {err}")
+        return None
+    return None if row is None else row[0]
+
+
+def store_cached_cost(key, cost):
+    if EVAL_CACHE is None:
+        return
+    try:
+        EVAL_CACHE.execute("INSERT OR REPLACE INTO cache (key, cost) VALUES (?, ?)", (key, cost))
+    except sqlite3.Error as err:
+        logging.warning(f"Failed to write to evaluation cache: {err}")
+
+
+EVAL_CACHE = open_eval_cache(SMAC_OUTPUT_DIR / "eval_cache.sqlite")
+
+
 def show_error_log(plan_dir):
     try:
         with open(plan_dir / "run.err") as f:
@@ -142,11 +198,20 @@ def show_error_log(plan_dir):
 
 
 def parse_runtime(plan_dir):
-    with open(plan_dir / "run.log") as f:
-        output = f.read()
-    logging.debug(f"\n\nPlanner output:\n\n{output}\n\n")
-    match = re.search("runtime: (.+?)s real", output)
-    runtime = float(match.group(1))
+    logfile = plan_dir / "run.log"
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        with open(logfile) as f:
+            output = f.read()
+        logging.debug(f"\n\nPlanner output:\n\n{output}\n\n")
+    # The runtime is printed near the end of the log, so only read its tail first.
+    with open(logfile, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - RUNTIME_TAIL_SIZE))
+        match = RUNTIME_REGEX.search(f.read())
+        if match is None:
+            f.seek(0)
+            match = RUNTIME_REGEX.search(f.read())
+    runtime = float(match.group(1).decode())
     runtime = max(0.1, runtime)  # log(0) is undefined.
     return runtime
 
@@ -160,19 +225,56 @@ def store_results(cfg, seed, plan_dir, exitcode, runtime):
         "planner_exitcode": exitcode,
         "runtime": runtime,
     }
-    with open(plan_dir / "properties.json", "w") as props:
-        json.dump(
+    with open(plan_dir / "properties.json", "wb") as props:
+        props.write(orjson.dumps(
             results,
-            props,
-            indent=2,
-            separators=(",", ": "),
-            sort_keys=True,
-        )
+            option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        ))
+
+
+def get_eval_cache_key(cfg, seed):
+    # Include the planner setup to avoid reusing results when the output directory is reused.
+    data = {
+        "domain": ARGS.domain,
+        "planner": str(PLANNER),
+        "planner_time_limit": ARGS.planner_time_limit,
+        "planner_memory_limit": ARGS.planner_memory_limit,
+        "parameters": cfg,
+        "seed": int(seed),
+    }
+    return blake3.blake3(
+        orjson.dumps(data, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    ).hexdigest(length=16)
+
+
+def make_config_to_dict(cs):
+    """
+    Return a function that converts configurations of *cs* to dictionaries.
+
+    The hyperparameters are fixed for the whole run, so we look up their names,
+    vector indices and transformations only once instead of letting
+    Configuration.get_dictionary() do it for every configuration.
+    """
+    hyperparameters = [
+        (hp.name, cs.get_idx_by_hyperparameter_name(hp.name), hp._transform)
+        for hp in cs.get_hyperparameters()
+    ]
+
+    def config_to_dict(cfg):
+        vector = cfg.get_array()
+        return {
+            name: transform(vector[idx])
+            for name, idx, transform in hyperparameters
+            # Inactive hyperparameters have no value.
+            if np.isfinite(vector[idx])
+        }
+
+    return config_to_dict
 
 
 def evaluate_configuration(cfg, seed=1):
     peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-    cfg = cfg.get_dictionary()
+    cfg = CONFIG_TO_DICT(cfg)
 
     try:
         cfg = DOMAIN.adapt_parameters(cfg)
@@ -182,6 +284,12 @@ def evaluate_configuration(cfg, seed=1):
 
     logging.info(f"[{peak_memory} KB] Evaluate configuration {cfg} with seed {seed}")
 
+    cache_key = get_eval_cache_key(cfg, seed)
+    cached_cost = lookup_cached_cost(cache_key)
+    if cached_cost is not None:
+        logging.info(f"Reuse cached result for configuration {cfg} with seed {seed}")
+        return cached_cost
+
     try:
         plan_dir = utils.generate_input_files(
             GENERATORS_DIR, DOMAIN, cfg, seed, SMAC_RUN_DIR / TMP_PLAN_DIR)
@@ -193,20 +301,23 @@ def evaluate_configuration(cfg, seed=1):
     runtime = parse_runtime(plan_dir) if exitcode == 0 else None
     store_results(cfg, seed, plan_dir, exitcode, runtime)
     show_error_log(plan_dir)
-    subprocess.run(["xz", "run.log"], cwd=plan_dir)
+    XZ_POOL.submit(subprocess.run, ["xz", "-T1", "run.log"], cwd=plan_dir)
     if runtime is not None:
         logging.info(f"Solved task {cfg} in {runtime}s")
         # Maximize runtime.
-        return -runtime
+        cost = -runtime
     else:
         logging.info(f"Failed to solve task {cfg}")
-        return 100
+        cost = 100
+    store_cached_cost(cache_key, cost)
+    return cost
 
 
 # Build Configuration Space which defines all parameters and their ranges.
 cs = ConfigurationSpace()
 
 cs.add_hyperparameters(DOMAIN.attributes)
+CONFIG_TO_DICT = make_config_to_dict(cs)
 
 scenario = Scenario(
     {
@@ -1,7 +1,35 @@
+import functools
 import logging
+import os
 from pathlib import Path
 import shutil
+import stat
 import sys
+import threading
+
+
+# Target directories for which collect_task() has already written the shared files.
+_CREATED_DIRS = set()
+_CREATED_DIRS_LOCK = threading.Lock()
+
+_COPY_CHUNK_SIZE = 1 << 30
+_BUFFER_SIZE = 1 << 20
+
+
+def _copy_file_range(infd, outfd, offset):
+    return os.copy_file_range(infd, outfd, _COPY_CHUNK_SIZE, offset_src=offset)
+
+
+def _sendfile(infd, outfd, offset):
+    return os.sendfile(outfd, infd, offset, _COPY_CHUNK_SIZE)
+
+
+# Kernel-side copy functions in order of preference. copy_file_range() can
+# clone files on filesystems supporting reflinks.
+_ZERO_COPY_FUNCTIONS = [
+    func for func, name in [(_copy_file_range, "copy_file_range"), (_sendfile, "sendfile")]
+    if hasattr(os, name)
+]
 
 
 def generate_input_files(generators_dir, domain, parameters, seed, output_dir, timeout=None):
@@ -27,42 +55,104 @@ def generate_input_files(generators_dir, domain, parameters, seed, output_dir, t
     return plan_dir
 
 
+def _fastcopy(src, dst):
+    """
+    Copy src to dst and preserve timestamps and permissions like shutil.copy2().
+
+    The data is copied inside the kernel if possible. Otherwise, we fall back
+    to a buffered copy.
+    """
+    # Opening dst for writing would truncate src if both are the same file.
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise shutil.SameFileError(f"{src!r} and {dst!r} are the same file")
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        infd, outfd = fsrc.fileno(), fdst.fileno()
+        size = os.fstat(infd).st_size
+        offset = 0
+        for copy_chunk in _ZERO_COPY_FUNCTIONS:
+            try:
+                while offset < size:
+                    copied = copy_chunk(infd, outfd, offset)
+                    if not copied:
+                        break
+                    offset += copied
+            except OSError:
+                # Not supported for this platform or pair of filesystems.
+                continue
+            # Some kernels and filesystems return 0 instead of failing for
+            # unsupported copies, so only stop if the whole file was copied.
+            if offset >= size:
+                break
+        else:
+            fsrc.seek(offset)
+            shutil.copyfileobj(fsrc, fdst, length=_BUFFER_SIZE)
+    st = os.stat(src)
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.chmod(dst, stat.S_IMODE(st.st_mode))
+
+
+def _parameter_items(cfg):
+    # Include the types in the cache key since equal values like 1 and 1.0 are formatted differently.
+    return tuple((key, type(value), value) for key, value in sorted(cfg.items()))
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_parameters(items):
+    """Return the task name part and the parameter order for _parameter_items()."""
+    return _join_values(value for _, _, value in items), ", ".join(str(key) for key, _, _ in items)
+
+
+def get_problem_name(cfg, seed):
+    cfg_string, _ = _format_parameters(_parameter_items(cfg))
+    return f"p-{cfg_string}-{seed}.pddl"
+
+
 def collect_task(domain, cfg, seed, srcdir, destdir, copy_logs=False):
-    cfg_string = join_parameters(cfg)
+    # The same configurations recur for different seeds.
+    cfg_string, order = _format_parameters(_parameter_items(cfg))
     problem_name = f"p-{cfg_string}-{seed}.pddl"
     target_dir = destdir / domain.name
-    target_dir.mkdir(parents=True, exist_ok=True)
-    shutil.copy2(srcdir / "problem.pddl", target_dir / problem_name)
+    # Tasks may be collected from multiple threads, so let only one of them set up the directory.
+    with _CREATED_DIRS_LOCK:
+        if target_dir not in _CREATED_DIRS:
+            target_dir.mkdir(parents=True, exist_ok=True)
+            # The shared domain file only has to be copied once.
+            if not domain.uses_per_instance_domain_file():
+                _fastcopy(srcdir / "domain.pddl", target_dir / "domain.pddl")
+            # Write information about parameters.
+            with open(target_dir / "README", "w") as f:
+                print(f"Parameter order: {order}", file=f)
+            _CREATED_DIRS.add(target_dir)
+
+    _fastcopy(srcdir / "problem.pddl", target_dir / problem_name)
     if copy_logs:
         try:
-            shutil.copy2(srcdir / "run.log", target_dir / f"p-{cfg_string}-{seed}.log")
+            _fastcopy(srcdir / "run.log", target_dir / f"p-{cfg_string}-{seed}.log")
         except FileNotFoundError:
-            shutil.copy2(srcdir / "run.log.xz", target_dir / f"p-{cfg_string}-{seed}.log.xz")
+            _fastcopy(srcdir / "run.log.xz", target_dir / f"p-{cfg_string}-{seed}.log.xz")
 
-    # Copy domain file.
-    output_domain_filename = "domain.pddl"
     if domain.uses_per_instance_domain_file():
-        output_domain_filename = f"domain-p-{cfg_string}-{seed}.pddl"
-    shutil.copy2(srcdir / "domain.pddl", target_dir / output_domain_filename)
-
-    # Write information about parameters.
-    order = ", ".join(str(k) for k in sorted(cfg))
-    with open(target_dir / "README", "w") as f:
-        print(f"Parameter order: {order}", file=f)
+        _fastcopy(srcdir / "domain.pddl", target_dir / f"domain-p-{cfg_string}-{seed}.pddl")
 
     return problem_name
 
 
+def _format_value(value):
+    if isinstance(value, str):
+        value = value.strip("-")
+        if not value:
+            value = "empty"
+    elif isinstance(value, float):
+        value = f"{value:.2}"
+    return str(value)
+
+
+def _join_values(values):
+    return "-".join(_format_value(value) for value in values)
+
+
 def join_parameters(parameters: dict):
-    def format_value(value):
-        if isinstance(value, str):
-            value = value.strip("-")
-            if not value:
-                value = "empty"
-        elif isinstance(value, float):
-            value = f"{value:.2}"
-        return str(value)
-    return "-".join(format_value(value) for _, value in sorted(parameters.items()))
+    return _join_values(value for _, value in sorted(parameters.items()))
 
 
 def check_generators_dir(generators_dir, domains):